@@ -1,11 +1,11 @@
+from collections import OrderedDict
+from concurrent.futures import CancelledError
 from itertools import product as iproduct
 
-from geoviews import Dataset as GVDataset
-from holoviews import Dataset as HVDataset
 import numpy as np
 
 from .lookup import AXES_ORDER, CRS_LOOKUP, TRS_LOOKUP, VRS_LOOKUP
-from .util import dict_list_search, get_request
+from .util import get_request
 
 
 class DataHandler(object):
@@ -18,25 +18,35 @@ class DataHandler(object):
 
     """
     horizontal_axes_names = ["x", "y", "latitude", "longitude"]  # May need to be extended.
+    max_cache_items = 128  # Least recently used data arrays are dropped beyond this.
 
-    def __init__(self, data_json):
+    def __init__(self, data_json, session=None, executor=None):
         """
         Set up a data handler interface to the data response `data_json` from the EDR Server.
 
+        Optionally pass a `requests.Session` via `session` to reuse connections to the
+        EDR Server when requesting data, and a `.util.RequestExecutor` via `executor`
+        to make such requests concurrently.
+
         """
         self.data_json = data_json
-        self.cache = {}
+        self.session = session
+        self.executor = executor
+        self.cache = OrderedDict()
+        self._prefetch = None  # The (key, future) of a background request for the next array.
         self.colours = {}
 
         self._errors = None
         self._param_names = None
         self._coords = None
+        self._horizontal_points = None
         self._units = None
         self.shape = None
         self._selection_axes = None
         self._all_query_keys = None
         self._array = None
         self._all_data = None
+        self._referencing = None
         self._crs = None
         self._vrs = None
         self._trs = None
@@ -72,6 +82,29 @@ class DataHandler(object):
     def coords(self, value):
         self._coords = value
 
+    @property
+    def horizontal_points(self):
+        """
+        Tuple of `(x, y)` NumPy arrays of the horizontal coordinate points, converted
+        once from `self.coords` and reused every time a dataset is built for plotting.
+
+        """
+        if self._horizontal_points is None:
+            self.horizontal_points = tuple(
+                np.asarray(self.coords[axis], dtype=np.float32) for axis in ["x", "y"]
+            )
+        return self._horizontal_points
+
+    @horizontal_points.setter
+    def horizontal_points(self, value):
+        self._horizontal_points = value
+
+    @property
+    def grid_shape(self):
+        """The `(y, x)` shape of a single 2D horizontal slice of the data."""
+        x_points, y_points = self.horizontal_points
+        return len(y_points), len(x_points)
+
     @property
     def units(self):
         """A dictionary mapping parameter names to their unit strings."""
@@ -103,8 +136,7 @@ class DataHandler(object):
 
         """
         if self._selection_axes is None:
-            axes_names = list(self.coords.keys())
-            self.selection_axes = list(set(axes_names) - set(self.horizontal_axes_names))
+            self.selection_axes = list(self.coords.keys() - self.horizontal_axes_names)
         return self._selection_axes
 
     @selection_axes.setter
@@ -151,6 +183,21 @@ class DataHandler(object):
     def all_data(self, value):
         self._all_data = value
 
+    @property
+    def referencing(self):
+        """
+        Dict of the reference systems in `self.data_json`, keyed by the
+        tuple of coordinate axis names that each reference system describes.
+
+        """
+        if self._referencing is None:
+            self._build_referencing()
+        return self._referencing
+
+    @referencing.setter
+    def referencing(self, value):
+        self._referencing = value
+
     @property
     def crs(self):
         """Common coordinate reference system (crs) for all data represented by `self.data_json`."""
@@ -222,17 +269,14 @@ class DataHandler(object):
 
         """
         coords_data = self.data_json["domain"]["axes"]
-        axes_names = list(coords_data.keys())
         coords = {}
-        for axis_name in axes_names:
-            coord_data = coords_data[axis_name]
-            axis_keys = list(coord_data.keys())
-            if "start" in axis_keys:
+        for axis_name, coord_data in coords_data.items():
+            if "start" in coord_data:
                 coord_points = self._build_coord_points(coord_data)
-            elif "values" in axis_keys:
+            elif "values" in coord_data:
                 coord_points = list(coord_data["values"])
             else:
-                bad_keys = ", ".join(axis_keys)
+                bad_keys = ", ".join(coord_data)
                 raise KeyError(f"Could not build coordinate from keys: {bad_keys!r}.")
             coords[axis_name] = coord_points
         self.coords = coords
@@ -244,30 +288,42 @@ class DataHandler(object):
             units_dict[name] = unit_string
         return units_dict
 
+    def _build_referencing(self):
+        """Index the reference systems in `data_json` by the coordinates they describe."""
+        referencing = {}
+        for ref in self.data_json["domain"]["referencing"]:
+            # Keep the first reference system for a set of coordinates, should there be several.
+            referencing.setdefault(tuple(ref["coordinates"]), ref)
+        self.referencing = referencing
+
+    def _get_reference_system(self, coords):
+        """Retrieve the reference system in `data_json` that describes the coordinates `coords`."""
+        try:
+            return self.referencing[tuple(coords)]
+        except KeyError:
+            raise ValueError(f"No reference system could be found for coordinates {coords}.")
+
     def _get_data_crs(self):
         """Retrieve the horizontal coordinate reference system from `data_json`."""
-        ref_systems = self.data_json["domain"]["referencing"]
-        axes_names = list(self.data_json["domain"]["axes"].keys())
-        crs_axes = sorted(list(set(axes_names) & set(self.horizontal_axes_names)))
+        axes_names = self.data_json["domain"]["axes"].keys()
+        crs_axes = sorted(axes_names & self.horizontal_axes_names)
         try:
-            ref = dict_list_search(ref_systems, "coordinates", crs_axes)
+            ref = self._get_reference_system(crs_axes)
         except ValueError:
             # Try reversing the CRS axes, just in case.
-            ref = dict_list_search(ref_systems, "coordinates", crs_axes[::-1])
+            ref = self._get_reference_system(crs_axes[::-1])
         crs_type = ref["system"]["type"]
         self.crs = CRS_LOOKUP[crs_type]
 
     def _get_data_vrs(self):
         """Retrieve the vertical coordinate reference system from `data_json`."""
-        ref_systems = self.data_json["domain"]["referencing"]
-        ref = dict_list_search(ref_systems, "coordinates", ["z"])
+        ref = self._get_reference_system(["z"])
         vrs_type = ref["system"]["type"]
         self.vrs = VRS_LOOKUP[vrs_type]
 
     def _get_data_trs(self):
         """Retrieve the time coordinate reference system from `data_json`."""
-        ref_systems = self.data_json["domain"]["referencing"]
-        ref = dict_list_search(ref_systems, "coordinates", ["t"])
+        ref = self._get_reference_system(["t"])
         trs_type = ref["system"]["calendar"]
         self.trs = TRS_LOOKUP[trs_type]
 
@@ -295,13 +351,18 @@ class DataHandler(object):
 
     def _build_geoviews(self, array, param_name):
         """Construct a GeoViews Dataset object from an nD array data response."""
+        # Plotting libraries are slow to import and are not needed just to access data.
+        from geoviews import Dataset as GVDataset
+        from holoviews import Dataset as HVDataset
+
         colours = self.get_colours(param_name)
         if colours is not None:
             data = np.ma.masked_less(array, colours["vmin"])
         else:
             data = np.ma.masked_invalid(array)
+        x_points, y_points = self.horizontal_points
         ds = HVDataset(
-            data=(self.coords["x"], self.coords["y"], data),
+            data=(x_points, y_points, data),
             kdims=["longitude", "latitude"],
             vdims=param_name,
         )
@@ -313,21 +374,26 @@ class DataHandler(object):
         handling `NoneType` values by applying a mask at those points.
         
         """
+        if None not in values:
+            # Nothing to mask, so convert straight to the target dtype.
+            return np.fromiter(values, dtype=dtype, count=len(values)).reshape(shape)
+        # Mask the points with no value.
         a = np.array(values)
-        # Do we need to mask?
-        if any([v is None for v in values]):
-            fill_value = 999999 if dtype == "int" else 1e20
-            a[a == None] = fill_value
-            a = np.ma.masked_equal(a, fill_value)
+        fill_value = 999999 if dtype == "int" else 1e20
+        a[a == None] = fill_value
+        a = np.ma.masked_equal(a, fill_value)
         return a.astype(dtype).reshape(shape)
 
-    def _request_data(self, param, coords_dict):
+    def _fetch_array(self, param, coords_dict):
         """
         Request data from the EDR Server and handle converting the response
         into an appropriate type for caching and disseminating.
 
+        Returns a tuple of `(array, emsg)`, where `emsg` describes any error from
+        the request. The state of the data handler is not modified, so this can be
+        called from worker threads.
+
         """
-        self.errors = None
         param_info = self.data_json["ranges"][param]
         param_type = param_info["type"]
 
@@ -338,7 +404,7 @@ class DataHandler(object):
             template_dict[k] = self.coords[k].index(target_v_type(v))
         url_template = param_info["tileSets"][0]["urlTemplate"]
         url = url_template.format(**template_dict)
-        r, status_code, errors = get_request(url)
+        r, status_code, errors = get_request(url, session=self.session)
 
         array = None
         if r is not None:
@@ -349,13 +415,101 @@ class DataHandler(object):
                     array = result
             else:
                 raise NotImplementedError(f"Cannot process parameter type {param_type!r}")
+        emsg = None
         if errors is not None:
             emsg = errors
             if status_code is not None:
                 emsg += f" ({status_code})"
+        return array, emsg
+
+    def _request_data(self, param, coords_dict):
+        """
+        Request a single data array from the EDR Server, recording any error in `self.errors`.
+        The result of a matching background prefetch is used if there is one.
+
+        """
+        self.errors = None
+        result = self._take_prefetched(self.make_key(param, coords_dict))
+        if result is None:
+            result = self._fetch_array(param, coords_dict)
+        array, emsg = result
+        if emsg is not None:
             self.errors = emsg
         return array
 
+    def _fetch_arrays(self, queries):
+        """
+        Get the data arrays for all `(param, coords_dict)` pairs in `queries`.
+        Arrays not already in the data cache are requested from the EDR Server
+        concurrently, using `self.executor`.
+
+        """
+        self.errors = None
+        keys = [self.make_key(param, coords_dict) for param, coords_dict in queries]
+        results = {}
+        futures = {}
+        for key, (param, coords_dict) in zip(keys, queries):
+            if self.cache.get(key) is not None:
+                results[key] = self.cache[key]
+            elif key not in futures:
+                futures[key] = self.executor.submit(self._fetch_array, param, coords_dict)
+        for key, future in futures.items():
+            array, emsg = future.result()
+            if emsg is not None and self.errors is None:
+                self.errors = emsg
+            results[key] = array
+            self._cache_array(key, array)
+        return [results[key] for key in keys]
+
+    def _take_prefetched(self, key):
+        """
+        Return the `(array, emsg)` result of the background prefetch for the data
+        array `key`, or `None` if that array was not prefetched.
+
+        """
+        if self._prefetch is None or self._prefetch[0] != key:
+            return None
+        _, future = self._prefetch
+        self._prefetch = None
+        try:
+            return future.result()
+        except CancelledError:
+            return None
+
+    def _prefetch_next(self, param, coords_dict):
+        """
+        Request the data array at the time point after `coords_dict["t"]` in the
+        background, as it is likely to be the next array asked for.
+
+        """
+        if self.executor is None or "t" not in coords_dict:
+            return
+        t_points = self.coords["t"]
+        try:
+            t_idx = t_points.index(type(t_points[0])(coords_dict["t"]))
+            next_t = t_points[t_idx + 1]
+        except (AttributeError, IndexError, ValueError):
+            # Time points not held as a list, or no later time point.
+            return
+        next_coords = dict(coords_dict, t=next_t)
+        key = self.make_key(param, next_coords)
+        if self.cache.get(key) is not None:
+            return
+        if self._prefetch is not None:
+            if self._prefetch[0] == key:
+                return
+            self._prefetch[1].cancel()  # Only one prefetch is kept.
+            self._prefetch = None
+        future = self.executor.submit_background(self._fetch_array, param, next_coords)
+        if future is not None:
+            self._prefetch = (key, future)
+
+    def _cache_array(self, key, array):
+        """Add `array` to the data cache, dropping the least recently used arrays if it is full."""
+        self.cache[key] = array
+        while len(self.cache) > self.max_cache_items:
+            self.cache.popitem(last=False)
+
     def get_item(self, param, coords_dict, dataset=True):
         """Get a single dataset from the data cache, or populate it into the cache if not present."""
         key = self.make_key(param, coords_dict)
@@ -364,10 +518,13 @@ class DataHandler(object):
             indices = self._build_indexer(param, coords_dict)
             result = a[indices].squeeze()  # Drop length-1 dims.
         elif self.cache.get(key) is not None:
+            self.cache.move_to_end(key)
             result = self.cache[key]
         else:
             result = self._request_data(param, coords_dict)
-            self.cache[key] = result
+            self._cache_array(key, result)
+        if self.array.get(param) is None:
+            self._prefetch_next(param, coords_dict)
         if dataset:
             result = self._build_geoviews(result, param)
         return result
@@ -446,14 +603,17 @@ class DataHandler(object):
         return tuple(indices)
 
     def build_data_array(self, param_name):
-        relevant_queries = filter(
-            lambda q: q[0] == param_name,
-            self.all_query_keys
-        )
+        relevant_queries = [q for q in self.all_query_keys if q[0] == param_name]
         template_array = np.empty(self.shape)
-        for query in relevant_queries:
-            param, coords_dict = query
-            array = self.get_item(param, coords_dict, dataset=False)
+        if self.executor is not None and self.array.get(param_name) is None:
+            # Overlap the requests for all the arrays that make up the full data array.
+            arrays = self._fetch_arrays(relevant_queries)
+        else:
+            arrays = [
+                self.get_item(param, coords_dict, dataset=False)
+                for param, coords_dict in relevant_queries
+            ]
+        for (param, coords_dict), array in zip(relevant_queries, arrays):
             insertion_inds = self._build_indexer(param, coords_dict)
             template_array[insertion_inds] = array
         return template_array
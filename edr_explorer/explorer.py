@@ -1,15 +1,19 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, ExitStack
+from functools import partial
+import weakref
+
 import ipywidgets as widgets
 
 import cartopy.crs as ccrs
-import geoviews as gv
-import holoviews as hv
 import numpy as np
 import panel as pn
 import param
-from shapely.geometry import Polygon as sPolygon, LineString as sLineString
 
 from .interface import EDRInterface
 from .lookup import CRS_LOOKUP
+from .util import first_index
 
 
 class EDRExplorer(param.Parameterized):
@@ -17,54 +21,21 @@ class EDRExplorer(param.Parameterized):
     A `Panel` dashboard from which you can explore the data presented by an EDR Server.
 
     """
-    # Metadata widgets.
-    coll_uri = widgets.Text(placeholder='Specify an EDR Server...', description='Server')
-    coll = widgets.Dropdown(options=[], description='Collections', disabled=True)
-    locations = widgets.Dropdown(options=[], description='Locations', disabled=True)
-    datasets = widgets.SelectMultiple(options=[], description="Datasets", disabled=True)
-    start_time = widgets.Dropdown(options=[], description='Start Date', disabled=True)
-    end_time = widgets.Dropdown(options=[], description='End Date', disabled=True)
-    start_z = widgets.Dropdown(options=[], description='Z Lower', disabled=True)
-    end_z = widgets.Dropdown(options=[], description='Z Upper', disabled=True)
-
-    # Error display widgets.
-    connect_error_box = widgets.HTML("", layout=widgets.Layout(display="none"))
-    data_error_box = widgets.HTML("", layout=widgets.Layout(display="none"))
-
-    # Plot control widgets.
-    pc_times = widgets.SelectionSlider(options=[""], description="Timestep", disabled=True)
-    pc_zs = widgets.SelectionSlider(options=[""], description="Z Level", disabled=True)
-    pc_params = widgets.Dropdown(options=[], description="Parameter", disabled=True)
-    use_colours = pn.widgets.Checkbox(name="Use supplied colours", disabled=True)
-    use_levels = pn.widgets.Checkbox(name="Use supplied levels", disabled=True)
-
     # Parameters for triggering plot updates.
     _data_key = param.String("")
-    _colours = param.Boolean(use_colours.value)
-    _levels = param.Boolean(use_levels.value)
-    cmap = param.String("viridis")
-    alpha = param.Magnitude(0.85)
-
-    # Buttons.
-    connect_button = widgets.Button(description="Connect")
-    submit_button = widgets.Button(description="Submit", disabled=True)
-    dataset_button = widgets.Button(
-        description="Get Dataset",
-        disabled=True,
-        layout=widgets.Layout(top="-0.5rem")
+    style = param.Dict(
+        {"cmap": "viridis", "alpha": 0.85, "use_colours": False, "use_levels": False}
     )
 
-    # Lists and boxes aggregating multiple widgets.
-    wlist = [coll, locations, datasets, start_time, end_time, start_z, end_z]  # Metadata widgets.
-    pwlist = [pc_times, pc_zs, pc_params]  # Plot widgets.
-    pchecklist = [use_colours, use_levels]
-    wbox = widgets.VBox(wlist)
-    pwbox = pn.Row(pn.Column(*pwlist[:2]), pwlist[-1], pn.Column(*pchecklist))
-
     # Map projection code
     web_mercator_epsg = "EPSG:3857"
 
-    def __init__(self, server_address=None):
+    # Default size of the plot, and of the raster sent to the browser for grids with
+    # more cells than the plot has pixels.
+    rasterize_width = 800
+    rasterize_height = 600
+
+    def __init__(self, server_address=None, image_cache_size=32):
         """
         Set up a new `Panel` dashboard to use to explore the data presented by an
         EDR Server. This constructs an instance of `.interface.EDRInterface` to submit
@@ -74,21 +45,45 @@ class EDRExplorer(param.Parameterized):
         Optionally pass the hostname of an EDR server via `server_address`. If specified,
         this value will pre-populate the `Server` field of the interface.
 
+        Plotted images are kept for reuse when the same data is shown again; set the
+        maximum number of images kept with `image_cache_size`.
+
         """
+        super().__init__()
+
+        # Widgets are created per instance so that multiple dashboards do not share state.
+        self._build_widgets()
+
         self.server_address = server_address
         if self.server_address is not None:
             self.coll_uri.value = self.server_address
 
-        super().__init__()
-
         # Class properties.
         self._edr_interface = None
+        self._last_connected_uri = None
+        self._last_collection_id = None
         self._dataset = None
         self._no_t = "No t values in collection"
         self._no_z = "No z values in collection"
+        self._meta_cache = {}
+        self._time_index = {}
+        self._z_index = {}
+
+        # Requests to the EDR Server are made off the UI thread so the dashboard stays responsive.
+        self._executor = ThreadPoolExecutor(max_workers=2)
+        self._finalizer = weakref.finalize(
+            self, self._executor.shutdown, wait=False, cancel_futures=True
+        )
 
         # Plot.
-        self.plot = gv.DynamicMap(self.make_plot)
+        # GeoViews, HoloViews and Shapely are slow to import, so are only imported where needed.
+        import geoviews as gv
+        import holoviews as hv
+
+        self._placeholder = self._placeholder_image()
+        self._layout = None
+        self.image_cache_size = image_cache_size
+        self._image_cache = OrderedDict()  # Unstyled images keyed by `_data_key`.
 
         # Button click bindings.
         self.connect_button.on_click(self._load_collections)
@@ -110,8 +105,80 @@ class EDRExplorer(param.Parameterized):
         self._corridor_path = None
         self._area_stream = None
         self._corridor_stream = None
+        self._geometry_wkt = {"area": None, "corridor": None}
         self._query_tools()
 
+        # The data image is kept on a layer of its own so that large grids are rasterized
+        # afresh for the plot's current ranges and size as the plot is zoomed and panned.
+        image_plot = gv.DynamicMap(self.make_plot).apply(
+            self._rasterize, streams=[hv.streams.RangeXY, hv.streams.PlotSize]
+        )
+        self.plot = image_plot * self._area_poly * self._corridor_path
+
+    def _build_widgets(self):
+        """Construct all the widgets that make up the dashboard."""
+        # Metadata widgets.
+        self.coll_uri = widgets.Text(placeholder='Specify an EDR Server...', description='Server')
+        self.coll = widgets.Dropdown(options=[], description='Collections', disabled=True)
+        self.locations = widgets.Dropdown(options=[], description='Locations', disabled=True)
+        self.datasets = widgets.SelectMultiple(options=[], description="Datasets", disabled=True)
+        self.start_time = widgets.Dropdown(options=[], description='Start Date', disabled=True)
+        self.end_time = widgets.Dropdown(options=[], description='End Date', disabled=True)
+        self.start_z = widgets.Dropdown(options=[], description='Z Lower', disabled=True)
+        self.end_z = widgets.Dropdown(options=[], description='Z Upper', disabled=True)
+
+        # Error display widgets. Their layouts are shared rather than rebuilt on every change.
+        self._error_hidden_layout = widgets.Layout(
+            display="none",
+            visibility="hidden",
+            border="none",
+        )
+        self._error_shown_layout = widgets.Layout(
+            border="2px solid #dc3545",
+            padding="0.05rem 0.5rem",
+            margin="0 0.25rem 0 5.625rem",
+            width="70%",
+            overflow="auto",
+            display="flex",
+        )
+        self.connect_error_box = widgets.HTML("", layout=self._error_hidden_layout)
+        self.data_error_box = widgets.HTML("", layout=self._error_hidden_layout)
+
+        # Plot control widgets.
+        # Sliders only update once released, rather than for every value dragged past.
+        self.pc_times = widgets.SelectionSlider(
+            options=[""], description="Timestep", disabled=True, continuous_update=False
+        )
+        self.pc_zs = widgets.SelectionSlider(
+            options=[""], description="Z Level", disabled=True, continuous_update=False
+        )
+        self.pc_params = widgets.Dropdown(options=[], description="Parameter", disabled=True)
+        self.use_colours = pn.widgets.Checkbox(name="Use supplied colours", disabled=True)
+        self.use_levels = pn.widgets.Checkbox(name="Use supplied levels", disabled=True)
+
+        # Buttons.
+        self.connect_button = widgets.Button(description="Connect")
+        self.submit_button = widgets.Button(description="Submit", disabled=True)
+        self.dataset_button = widgets.Button(
+            description="Get Dataset",
+            disabled=True,
+            layout=widgets.Layout(top="-0.5rem")
+        )
+
+        # Lists and boxes aggregating multiple widgets.
+        self.wlist = [
+            self.coll, self.locations, self.datasets,
+            self.start_time, self.end_time, self.start_z, self.end_z,
+        ]  # Metadata widgets.
+        self.pwlist = [self.pc_times, self.pc_zs, self.pc_params]  # Plot widgets.
+        self.pchecklist = [self.use_colours, self.use_levels]
+        self.wbox = widgets.VBox(self.wlist)
+        self.pwbox = pn.Row(
+            pn.Column(*self.pwlist[:2]),
+            self.pwlist[-1],
+            pn.Column(*self.pchecklist)
+        )
+
     @property
     def edr_interface(self):
         """The instance of `.interface.EDRInterface` used to handle requests to the EDR Server."""
@@ -135,10 +202,45 @@ class EDRExplorer(param.Parameterized):
     def dataset(self, value):
         self._dataset = value
 
+    @property
+    def cmap(self):
+        """The colormap used to plot data."""
+        return self.style["cmap"]
+
+    @cmap.setter
+    def cmap(self, value):
+        self.update_style(cmap=value)
+
+    @property
+    def alpha(self):
+        """The alpha (transparency) used to plot data, between 0 and 1."""
+        return self.style["alpha"]
+
+    @alpha.setter
+    def alpha(self, value):
+        if not 0 <= value <= 1:
+            raise ValueError(f"`alpha` must be between 0 and 1, got {value}.")
+        self.update_style(alpha=value)
+
+    def close(self):
+        """Close the worker threads and the connection to the EDR Server used by the dashboard."""
+        self._finalizer()
+        if self.edr_interface is not None:
+            self.edr_interface.close()
+
+    def update_style(self, **style):
+        """
+        Update one or more of the options in `self.style` used to plot data.
+        All options are updated together, so the plot is only updated once.
+
+        """
+        self.style = {**self.style, **style}
+
     @property
     def layout(self):
         """
         Construct a layout of `Panel` objects to produce the EDR explorer dashboard.
+        The layout is constructed on first access and reused thereafter.
         To view the dashboard:
             explorer = EDRExplorer()
             explorer.layout
@@ -166,37 +268,73 @@ class EDRExplorer(param.Parameterized):
             show data on the plot rendered using colours and levels supplied in the query response.
 
         """
-        connect_row = pn.Row(
-            pn.Column(self.coll_uri, self.connect_error_box),
-            self.connect_button
-        )
-        control_widgets = pn.Column(self.wbox, self.data_error_box)
-        buttons = pn.Column(self.submit_button, self.dataset_button)
-        control_row = pn.Row(control_widgets, buttons, align=("end", "start"))
-        control_col = pn.Column(connect_row, control_row)
+        if self._layout is None:
+            import geoviews as gv
+
+            connect_row = pn.Row(
+                pn.Column(self.coll_uri, self.connect_error_box),
+                self.connect_button
+            )
+            control_widgets = pn.Column(self.wbox, self.data_error_box)
+            buttons = pn.Column(self.submit_button, self.dataset_button)
+            control_row = pn.Row(control_widgets, buttons, align=("end", "start"))
+            control_col = pn.Column(connect_row, control_row)
+
+            tiles = gv.tile_sources.Wikipedia.opts(
+                width=self.rasterize_width, height=self.rasterize_height
+            )
+            plot = tiles * self.plot
+            plot_col = pn.Column(plot, self.pwbox)
+            self._layout = pn.Row(control_col, plot_col).servable()
+        return self._layout
+
+    @contextmanager
+    def _hold_updates(self, widget_list):
+        """
+        Hold front-end syncs of the widgets in `widget_list`, and of the Panel document,
+        until the end of the block so that multiple changes are sent together.
+
+        """
+        with ExitStack() as stack:
+            stack.enter_context(pn.io.hold())
+            for widget in widget_list:
+                stack.enter_context(widget.hold_sync())
+            yield
+
+    def _run_in_background(self, fn, callback, *args, **kwargs):
+        """
+        Call `fn(*args, **kwargs)` on a worker thread, then call `callback` with the
+        completed future. If the dashboard is being served, `callback` is scheduled
+        on the server's document so that widgets are updated from the right thread.
+        Otherwise, such as in a notebook, `callback` is deliberately run directly on the
+        worker thread: ipywidgets send their state to the front-end from whichever thread
+        sets it, and the controls are disabled while the work is in progress so that the
+        callback does not race with user changes.
+
+        Exceptions from `fn` are raised by `future.result()`. As these would otherwise
+        only be logged, `callback` must catch them and show them to the user.
+
+        """
+        doc = pn.state.curdoc
+
+        def done(future):
+            if doc is not None and doc.session_context is not None:
+                doc.add_next_tick_callback(partial(callback, future))
+            else:
+                callback(future)
 
-        tiles = gv.tile_sources.Wikipedia.opts(width=800, height=600)
-        plot = tiles * self.plot
-        plot_col = pn.Column(plot, self.pwbox)
-        return pn.Row(control_col, plot_col).servable()
+        future = self._executor.submit(fn, *args, **kwargs)
+        future.add_done_callback(done)
+        return future
 
     def _populate_error_box(self, error_box_ref, errors):
         error_box = getattr(self, error_box_ref)
-        good_layout = widgets.Layout(
-            display="none",
-            visibility="hidden",
-            border="none",
-        )
-        bad_layout = widgets.Layout(
-            border="2px solid #dc3545",
-            padding="0.05rem 0.5rem",
-            margin="0 0.25rem 0 5.625rem",
-            width="70%",
-            overflow="auto",
-            display="flex",
-        )
-        error_box.value = errors
-        error_box.layout = good_layout if errors == "" else bad_layout
+        layout = self._error_hidden_layout if errors == "" else self._error_shown_layout
+        # Only sync changes to the front-end.
+        if error_box.value != errors:
+            error_box.value = errors
+        if error_box.layout is not layout:
+            error_box.layout = layout
 
     def _load_collections(self, event):
         """
@@ -205,19 +343,63 @@ class EDRExplorer(param.Parameterized):
         Set up the EDR interface instance and connect to the server's collections.
 
         """
-        self._clear_controls()
         server_loc = self.coll_uri.value
-        self.edr_interface = EDRInterface(server_loc)
+        already_connected = (
+            server_loc == self._last_connected_uri
+            and self.edr_interface is not None
+            and self.edr_interface.errors is None
+        )
+        if already_connected:
+            # Avoid needlessly resetting all the controls.
+            return
 
+        self._last_connected_uri = None
+        self._clear_controls()
+        self._meta_cache = {}
+        self._image_cache.clear()
+        self.connect_button.disabled = True
+        self._run_in_background(self._connect, self._apply_collections, server_loc)
+
+    def _connect(self, server_loc):
+        """
+        Construct an interface to the EDR Server at `server_loc` and request
+        its `collections` metadata. This blocks, so is run on a worker thread.
+
+        """
+        edr_interface = EDRInterface(server_loc)
+        edr_interface.json
+        return edr_interface
+
+    def _apply_collections(self, future):
+        """
+        Callback when the connection to the EDR Server made by `_load_collections`
+        has completed.
+
+        Populate the collections widget from the server's collections.
+
+        """
+        self.connect_button.disabled = False
         error_box = "connect_error_box"
+        try:
+            edr_interface = future.result()
+        except Exception as e:
+            self._populate_error_box(error_box, e.__class__.__name__)
+            return
+        # Only replace the existing interface once the new one is known to be usable.
+        if self.edr_interface is not None:
+            self.edr_interface.close()
+        self.edr_interface = edr_interface
+
         if self.edr_interface.errors is None:
             # Independent check to see if we can clear the error box.
             self._populate_error_box(error_box, "")
         if self.edr_interface.json is not None and self.edr_interface.errors is None:
             # The only state in which the controls can be populated and enabled.
-            self.coll.options = [(ct, cid) for (cid, ct) in zip(self.edr_interface.collection_ids, self.edr_interface.collection_titles)]
-            self.coll.value = self.edr_interface.collection_ids[0]
-            self._enable_controls()
+            self._last_connected_uri = self.edr_interface.server_host
+            with self._hold_updates([self.coll]):
+                self.coll.options = [(ct, cid) for (cid, ct) in zip(self.edr_interface.collection_ids, self.edr_interface.collection_titles)]
+                self.coll.value = self.edr_interface.collection_ids[0]
+                self._enable_controls()
         elif self.edr_interface.errors is not None:
             # We have known errors to show.
             self._populate_error_box(error_box, self.edr_interface.errors)
@@ -233,24 +415,25 @@ class EDRExplorer(param.Parameterized):
 
     def _clear_controls(self):
         """Clear state of all control and error display widgets and disable them."""
-        for widget in self.wlist + self.pwlist:
-            widget.disabled = True
-            if isinstance(widget, widgets.SelectMultiple):
-                widget.options = ("",)
-                widget.value = ("",)
-            elif isinstance(widget, widgets.SelectionSlider):
-                widget.options = ("",)
-                widget.value = ""
-            else:
-                widget.options = []
-                widget.value = None
-        for box in self.pchecklist:
-            box.value = False
-            box.disabled = True
-        self.submit_button.disabled = True
-        self.dataset_button.disabled = True
-        self._populate_error_box("connect_error_box", "")
-        self._populate_error_box("data_error_box", "")
+        with self._hold_updates(self.wlist + self.pwlist):
+            for widget in self.wlist + self.pwlist:
+                widget.disabled = True
+                if isinstance(widget, widgets.SelectMultiple):
+                    widget.options = ("",)
+                    widget.value = ("",)
+                elif isinstance(widget, widgets.SelectionSlider):
+                    widget.options = ("",)
+                    widget.value = ""
+                else:
+                    widget.options = []
+                    widget.value = None
+            for box in self.pchecklist:
+                box.value = False
+                box.disabled = True
+            self.submit_button.disabled = True
+            self.dataset_button.disabled = True
+            self._populate_error_box("connect_error_box", "")
+            self._populate_error_box("data_error_box", "")
 
     def _check_enable_checkboxes(self):
         """
@@ -259,21 +442,20 @@ class EDRExplorer(param.Parameterized):
         possible if this information is present in the data JSON.
 
         """
-        box_disabled = self.edr_interface.data_handler.get_colours(self.pc_params.value) is None
+        data_handler = self.edr_interface.data_handler
+        box_disabled = data_handler is None or data_handler.get_colours(self.pc_params.value) is None
         for box in self.pchecklist:
             box.disabled = box_disabled
 
     def _checkbox_change(self, event):
         """
-        Bind a change in a checkbox to the relevant param object to trigger
-        a plot update.
+        Bind a change in a checkbox to the plot style to trigger a plot update.
 
         """
-        name = event.obj.name
-        if "colour" in name:
-            self._colours = event.new
-        elif "level" in name:
-            self._levels = event.new
+        self.update_style(
+            use_colours=self.use_colours.value,
+            use_levels=self.use_levels.value,
+        )
 
     def _enable_plot_controls(self):
         """Enable plot control widgets for updating the specific data shown on the plot."""
@@ -282,6 +464,39 @@ class EDRExplorer(param.Parameterized):
         self.dataset_button.disabled = False
         self._check_enable_checkboxes()
 
+    def _get_metadata(self, method_name, collection_id):
+        """
+        Call the `.interface.EDRInterface` metadata method `method_name` for the
+        collection `collection_id`, caching the result so that repeat lookups of
+        the same metadata do not re-walk the collection's JSON.
+
+        """
+        key = (collection_id, method_name)
+        if key not in self._meta_cache:
+            method = getattr(self.edr_interface, method_name)
+            self._meta_cache[key] = method(collection_id)
+        return self._meta_cache[key]
+
+    def _get_collection_contents(self, collection_id):
+        """
+        Return the `(locations, times, zs)` values to show in the query control widgets
+        for the collection `collection_id`. The locations request to the EDR Server is
+        made concurrently with building the time and vertical values.
+
+        """
+        locs_future = self.edr_interface.executor.submit(
+            self._get_metadata, "get_locations", collection_id
+        )
+        if self._get_metadata("has_temporal_extent", collection_id):
+            times = self._get_metadata("get_temporal_extent", collection_id)
+        else:
+            times = [self._no_t]
+        if self._get_metadata("has_vertical_extent", collection_id):
+            zs = self._get_metadata("get_vertical_extent", collection_id)
+        else:
+            zs = [self._no_z]
+        return locs_future.result(), times, zs
+
     def _populate_contents_callback(self, change):
         """
         Populate the options and values attributes of all the left column query control
@@ -289,25 +504,26 @@ class EDRExplorer(param.Parameterized):
 
         """
         collection_id = change["new"]
+        if collection_id == self._last_collection_id:
+            # The widgets already show the contents of this collection.
+            return
         if collection_id is not None:
-            # Parameters and locations.
-            self._populate_params(collection_id)
-            locs = self.edr_interface.get_locations(collection_id)
-            self.locations.options = locs
-            # Times.
-            if self.edr_interface.has_temporal_extent(collection_id):
-                times = self.edr_interface.get_temporal_extent(collection_id)
-            else:
-                times = [self._no_t]
-            self.start_time.options = times
-            self.end_time.options = times
-            # Vertical levels.
-            if self.edr_interface.has_vertical_extent(collection_id):
-                zs = self.edr_interface.get_vertical_extent(collection_id)
-            else:
-                zs = [self._no_z]
-            self.start_z.options = zs
-            self.end_z.options = zs
+            # Retrieve all the collection's metadata before updating any widgets.
+            locs, times, zs = self._get_collection_contents(collection_id)
+
+            with self._hold_updates(self.wlist):
+                # Parameters and locations.
+                self._populate_params(collection_id)
+                self.locations.options = locs
+                # Times.
+                self._time_index = first_index(times)
+                self.start_time.options = times
+                self.end_time.options = times
+                # Vertical levels.
+                self._z_index = first_index(zs)
+                self.start_z.options = zs
+                self.end_z.options = zs
+        self._last_collection_id = collection_id
 
     def _populate_params(self, collection_id):
         """
@@ -315,12 +531,34 @@ class EDRExplorer(param.Parameterized):
         the parameters provided by the selected collection.
 
         """
-        params_dict = self.edr_interface.get_collection_parameters(collection_id)
-        options = []
-        for k, v in params_dict.items():
-            choice = f'{v["label"].replace("_", " ").title()} ({v["units"]})'
-            options.append((choice, k))
-        self.datasets.options = options
+        self.datasets.options = self._get_param_options(collection_id)
+
+    def _get_param_options(self, collection_id):
+        """
+        Return a list of `(description, parameter name)` options for the parameters
+        provided by the collection `collection_id`, cached with the collection's metadata.
+
+        """
+        key = (collection_id, "param_options")
+        if key not in self._meta_cache:
+            params_dict = self._get_metadata("get_collection_parameters", collection_id)
+            self._meta_cache[key] = [
+                (f'{v["label"].replace("_", " ").title()} ({v["units"]})', k)
+                for k, v in params_dict.items()
+            ]
+        return self._meta_cache[key]
+
+    def _get_param_labels(self, collection_id):
+        """
+        Return a dict of `{parameter name: label}` for the parameters provided by
+        the collection `collection_id`, cached with the collection's metadata.
+
+        """
+        key = (collection_id, "param_labels")
+        if key not in self._meta_cache:
+            params_dict = self._get_metadata("get_collection_parameters", collection_id)
+            self._meta_cache[key] = {k: v["label"] for k, v in params_dict.items()}
+        return self._meta_cache[key]
 
     def _filter_end_time(self, change):
         """
@@ -329,11 +567,10 @@ class EDRExplorer(param.Parameterized):
 
         """
         start_time_selected = change["new"]
-        if start_time_selected is not None:
+        sel_idx = self._time_index.get(start_time_selected)
+        if sel_idx is not None:
             # Avoid errors when clearing widget state.
-            times = self.start_time.options
-            sel_idx = times.index(start_time_selected)
-            self.end_time.options = times[sel_idx:]
+            self.end_time.options = self.start_time.options[sel_idx:]
 
     def _filter_end_z(self, change):
         """
@@ -342,11 +579,10 @@ class EDRExplorer(param.Parameterized):
 
         """
         start_z_selected = change["new"]
-        if start_z_selected is not None:
+        sel_idx = self._z_index.get(start_z_selected)
+        if sel_idx is not None:
             # Avoid errors when clearing widget state.
-            zs = self.start_z.options
-            sel_idx = zs.index(start_z_selected)
-            self.end_z.options = zs[sel_idx:]
+            self.end_z.options = self.start_z.options[sel_idx:]
 
     def _get_dataset(self, _):
         """
@@ -362,9 +598,9 @@ class EDRExplorer(param.Parameterized):
         from .dataset import make_dataset
 
         collection_id = self.coll.value
-        params = self.edr_interface.get_collection_parameters(collection_id)
+        labels = self._get_param_labels(collection_id)
         keys = self.datasets.value
-        names_dict = {k: v["label"] for k, v in params.items() if k in keys}
+        names_dict = {k: v for k, v in labels.items() if k in keys}
         dataset = make_dataset(self.edr_interface.data_handler, names_dict)
         self.dataset = dataset
 
@@ -386,7 +622,11 @@ class EDRExplorer(param.Parameterized):
 
         """
         data = self._geometry_stream_data(query_name)
-        return all(data["xs"][0]) and all(data["ys"][0])
+        if not len(data["xs"]):
+            # The geometry has been deleted.
+            return False
+        xs, ys = np.asarray(data["xs"][0]), np.asarray(data["ys"][0])
+        return bool(np.any(xs) or np.any(ys))
 
     def _hv_stream_to_wkt(self, query_name):
         """
@@ -395,6 +635,8 @@ class EDRExplorer(param.Parameterized):
         of the geometry.
         
         """
+        from shapely.geometry import Polygon as sPolygon, LineString as sLineString
+
         constructor = sPolygon if query_name == "area" else sLineString
         data = self._geometry_stream_data(query_name)
         xpoints, ypoints = np.array(data["xs"][0]), np.array(data["ys"][0])
@@ -411,6 +653,20 @@ class EDRExplorer(param.Parameterized):
             result = geom.wkt
         return result, errors
 
+    def _update_geometry_wkt(self, query_name, **kwargs):
+        """
+        Callback when the geometry specified by `query_name` is edited.
+
+        Convert the geometry to WKT as soon as it changes so that submitting a query
+        does not need to. The result is `None` if the geometry is not defined, otherwise
+        the `(wkt, errors)` pair from `_hv_stream_to_wkt`.
+
+        """
+        result = None
+        if self._geometry_query_is_defined(query_name):
+            result = self._hv_stream_to_wkt(query_name)
+        self._geometry_wkt[query_name] = result
+
     def _request_plot_data(self, _):
         """
         Callback when the `submit` button is clicked.
@@ -440,18 +696,44 @@ class EDRExplorer(param.Parameterized):
         errors = None
         query_types = ["area", "corridor"]
         for qtype in query_types:
-            if self._geometry_query_is_defined(qtype):
+            if self._geometry_wkt[qtype] is not None:
                 print(f"Query type: {qtype}")
                 query_type = qtype
-                coords, errors = self._hv_stream_to_wkt(query_type)
+                coords, errors = self._geometry_wkt[qtype]
                 if coords is not None:
                     query_params["coords"] = coords
         if query_type is None:
             query_type = "locations"
             query_params["loc_id"] = locations
 
-        # Request dataset.
-        self.edr_interface.query(coll_id, query_type, param_names, **query_params)
+        # Request dataset. The request replaces the interface's data handler, so
+        # freeze all the controls until it has completed.
+        with self._hold_updates(self.wlist + self.pwlist):
+            for widget in self.wlist + self.pwlist + self.pchecklist:
+                widget.disabled = True
+            self.submit_button.disabled = True
+            self.dataset_button.disabled = True
+        self._run_in_background(
+            self.edr_interface.query,
+            partial(self._apply_plot_data, coll_id=coll_id, param_names=param_names, errors=errors),
+            coll_id, query_type, param_names, **query_params
+        )
+
+    def _apply_plot_data(self, future, coll_id, param_names, errors):
+        """
+        Callback when the data request made by `_request_plot_data` has completed.
+
+        Populate and enable the plot control widgets from the data response, or show
+        the errors from the data request.
+
+        """
+        self._enable_controls()
+        try:
+            future.result()
+        except Exception as e:
+            self._populate_error_box("data_error_box", e.__class__.__name__)
+            return
+        self._image_cache.clear()  # Keys may be reused by the new data.
 
         # Collect coords and query errors, if present.
         all_errors = []
@@ -468,30 +750,46 @@ class EDRExplorer(param.Parameterized):
             self._populate_error_box(error_box, "")
         if self.edr_interface.data_handler is not None and self.edr_interface.errors is None:
             # Generate and enable the plot controls.
-            if self.edr_interface.has_temporal_extent(coll_id):
-                plot_control_times = list(self.edr_interface.data_handler.coords["t"])
-            else:
-                plot_control_times = [self._no_t]
-            self.pc_times.options = plot_control_times
-            self.pc_times.value = plot_control_times[0]
-
-            if self.edr_interface.has_vertical_extent(coll_id):
-                plot_control_zs = list(self.edr_interface.data_handler.coords["z"])
-            else:
-                plot_control_zs = [self._no_z]
-            self.pc_zs.options = plot_control_zs
-            self.pc_zs.value = plot_control_zs[0]
-
-            plot_control_params = list(param_names)
-            self.pc_params.options = list(filter(lambda o: o[1] in plot_control_params, self.datasets.options))
-            self.pc_params.value = plot_control_params[0]
-
-            self._enable_plot_controls()
+            last_data_key = self._data_key
+            with self._hold_updates(self.pwlist):
+                if self._get_metadata("has_temporal_extent", coll_id):
+                    plot_control_times = self._coord_values("t")
+                else:
+                    plot_control_times = [self._no_t]
+                self.pc_times.options = plot_control_times
+                self.pc_times.value = plot_control_times[0]
+
+                if self._get_metadata("has_vertical_extent", coll_id):
+                    plot_control_zs = self._coord_values("z")
+                else:
+                    plot_control_zs = [self._no_z]
+                self.pc_zs.options = plot_control_zs
+                self.pc_zs.value = plot_control_zs[0]
+
+                plot_control_params = list(param_names)
+                selected_params = set(plot_control_params)
+                self.pc_params.options = [o for o in self.datasets.options if o[1] in selected_params]
+                self.pc_params.value = plot_control_params[0]
+
+                self._enable_plot_controls()
+            if self._data_key == last_data_key:
+                # The new data reuses the key of the data already on the plot, so the
+                # plot has not been updated by setting the plot controls above.
+                self.param.trigger('_data_key')
         elif self.edr_interface.errors is not None:
             self._populate_error_box(error_box, self.edr_interface.errors)
         else:
             self._populate_error_box(error_box, "Uncaught error (data retrieval)")
 
+    def _coord_values(self, axis_name):
+        """
+        Return the points of the data coordinate `axis_name` as a list of Python values.
+        Coordinates built as NumPy arrays are converted in bulk with `tolist`.
+
+        """
+        points = self.edr_interface.data_handler.coords[axis_name]
+        return points.tolist() if isinstance(points, np.ndarray) else list(points)
+
     def _plot_change(self, _):
         """
         Helper function to capture changes from either plot control widget
@@ -502,7 +800,6 @@ class EDRExplorer(param.Parameterized):
         t = self.pc_times.value
         z = self.pc_zs.value
         can_request_data = False
-        self._check_enable_checkboxes()
 
         value_dict = {}
         if t not in (None, "", self._no_t):
@@ -512,10 +809,24 @@ class EDRExplorer(param.Parameterized):
             value_dict.update({"z": z})
             can_request_data = True
 
+        if self.edr_interface is None or self.edr_interface.data_handler is None:
+            # No data to plot, or a data request is in progress.
+            return
+
+        data_key = None
         if param is not None and can_request_data:
-            self._data_key = self.edr_interface.data_handler.make_key(param, value_dict)
+            data_key = self.edr_interface.data_handler.make_key(param, value_dict)
+            if data_key == self._data_key:
+                # The plot already shows this data.
+                return
+
+        self._check_enable_checkboxes()
+        if data_key is not None:
+            self._data_key = data_key
 
     def _query_tools(self):
+        import holoviews as hv
+
         self._area_poly = hv.Polygons(
             [[(0, 0), (0, 0)]]
         ).opts(
@@ -537,40 +848,113 @@ class EDRExplorer(param.Parameterized):
             num_objects=1,
             tooltip="Corridor Query Tool"
         )
+        self._area_stream.add_subscriber(partial(self._update_geometry_wkt, "area"))
+        self._corridor_stream.add_subscriber(partial(self._update_geometry_wkt, "corridor"))
 
-    @param.depends('_data_key', '_colours', '_levels', 'cmap', 'alpha')
-    def make_plot(self):
-        """Show data from a data request to the EDR Server on the plot."""
-        showable = gv.Image(
+    def _placeholder_image(self):
+        """A fully transparent image to show on the plot when there is no data to show."""
+        import geoviews as gv
+
+        return gv.Image(
             ([-8, -1], [53, 58], [[0, 0], [0, 0]]),  # Approximate UK extent.
             crs=CRS_LOOKUP["WGS_1984"],
         ).opts(alpha=0.0)
-        if self._data_key != "":
-            dataset = self.edr_interface.data_handler[self._data_key]
-            opts = {"cmap": self.cmap, "alpha": self.alpha, "colorbar": True}
-
-            colours = self.edr_interface.data_handler.get_colours(self.pc_params.value)
-            if colours is not None:
-                opts.update({"clim": (colours["vmin"], colours["vmax"])})
-                if self.use_colours.value:
-                    opts["cmap"] = colours["colours"]
-                if self.use_levels.value:
-                    opts["color_levels"] = colours["values"]
-
-            error_box = "data_error_box"
-            if self.edr_interface.data_handler.errors is None:
-                # Independent check to see if we can clear the data error box.
-                self._populate_error_box(error_box, "")
-            if dataset is not None and self.edr_interface.data_handler.errors is None:
-                showable = dataset.to(gv.Image, ['longitude', 'latitude']).opts(**opts)
-            elif self.edr_interface.data_handler.errors is not None:
-                self._populate_error_box(
-                    error_box,
-                    self.edr_interface.data_handler.errors
-                )
-            else:
-                self._populate_error_box(
-                    error_box,
-                    "Unspecified error (plotting)"
-                )
-        return showable * self._area_poly * self._corridor_path
\ No newline at end of file
+
+    def _rasterize(self, image, x_range=None, y_range=None, width=None, height=None, scale=1):
+        """
+        Aggregate an image of a large grid on the server with Datashader, so that only
+        a plot-sized raster of the currently visible ranges is sent to the browser.
+        Images with no more cells than the plot has pixels, or all images if Datashader
+        is not installed, are returned unchanged.
+
+        Called with the values of the plot's `RangeXY` and `PlotSize` streams, which are
+        unset until the plot is first rendered.
+
+        """
+        width = width or self.rasterize_width
+        height = height or self.rasterize_height
+        n_cells = (len(image.dimension_values(0, expanded=False))
+                   * len(image.dimension_values(1, expanded=False)))
+        if n_cells <= width * height:
+            return image
+        try:
+            from holoviews.operation.datashader import rasterize
+        except ImportError:
+            return image
+        return rasterize(
+            image,
+            aggregator="mean",
+            precompute=True,
+            dynamic=False,
+            x_range=x_range,
+            y_range=y_range,
+            width=int(width * scale),
+            height=int(height * scale),
+        )
+
+    def _build_image(self, data_key):
+        """
+        Return the unstyled image of the data referenced by `data_key`, along with
+        any errors from retrieving the data. Images are cached, so data that has
+        been plotted before is not retrieved or rebuilt.
+
+        """
+        import geoviews as gv
+
+        errors = None
+        image = self._image_cache.get(data_key)
+        if image is not None:
+            self._image_cache.move_to_end(data_key)
+        else:
+            dataset = self.edr_interface.data_handler[data_key]
+            errors = self.edr_interface.data_handler.errors
+            if dataset is not None and errors is None:
+                image = dataset.to(gv.Image, ['longitude', 'latitude'])
+                self._image_cache[data_key] = image
+                while len(self._image_cache) > self.image_cache_size:
+                    self._image_cache.popitem(last=False)
+        return image, errors
+
+    def _apply_style(self, image):
+        """
+        Return a copy of `image` styled according to `self.style`, leaving the
+        (possibly cached) `image` itself unstyled.
+
+        """
+        style = self.style
+        opts = {"cmap": style["cmap"], "alpha": style["alpha"], "colorbar": True}
+        data_handler = self.edr_interface.data_handler
+        colours = None if data_handler is None else data_handler.get_colours(self.pc_params.value)
+        if colours is not None:
+            opts.update({"clim": (colours["vmin"], colours["vmax"])})
+            if style["use_colours"]:
+                opts["cmap"] = colours["colours"]
+            if style["use_levels"]:
+                opts["color_levels"] = colours["values"]
+        return image.opts(clone=True, **opts)
+
+    @param.depends('_data_key', 'style')
+    def make_plot(self):
+        """Show data from a data request to the EDR Server on the plot."""
+        no_data = self.edr_interface is None or self.edr_interface.data_handler is None
+        if self._data_key == "" or no_data:
+            # Nothing to show (yet).
+            return self._placeholder
+
+        showable = self._placeholder
+        image, errors = self._build_image(self._data_key)
+
+        error_box = "data_error_box"
+        if errors is None:
+            # Independent check to see if we can clear the data error box.
+            self._populate_error_box(error_box, "")
+        if image is not None and errors is None:
+            showable = self._apply_style(image)
+        elif errors is not None:
+            self._populate_error_box(error_box, errors)
+        else:
+            self._populate_error_box(
+                error_box,
+                "Unspecified error (plotting)"
+            )
+        return showable
\ No newline at end of file
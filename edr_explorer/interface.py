@@ -1,10 +1,20 @@
-import re
-
-from edr_explorer.data import DataHandler
+from functools import cached_property
+from urllib.parse import quote, urlencode
+import weakref
 
 from .data import DataHandler
-from .lookup import CRS_LOOKUP, TRS_LOOKUP
-from .util import dict_list_search, get_request, ISO8601Expander
+from .util import (
+    get_request,
+    http_cache,
+    make_session,
+    ISO8601Expander,
+    RequestExecutor,
+)
+
+
+def _close_resources(session, executor):
+    session.close()
+    executor.shutdown()
 
 
 class EDRInterface(object):
@@ -16,21 +26,68 @@ class EDRInterface(object):
 
     _collections_query_str = "collections/?f=json"
     _query_str = "collections/{coll_id}/{query_type}?{query_str}"
+    _locations_query_str = "collections/{coll_id}/locations/{loc_id}?{query_str}"
+
+    max_connections = 4  # Limit on concurrent requests to the EDR Server.
+
+    # Lazily computed attributes that derive from the `collections` metadata.
+    _collections_attrs = [
+        "json",
+        "collections",
+        "collection_ids",
+        "collection_titles",
+        "_collection_index",
+        "_collection_summary",
+    ]
 
-    def __init__(self, server_host):
+    def __init__(self, server_host, cache_ttl=None):
         """
-        Construct an interface to an EDR Server accessible at the URI specified in `server_host`
-        and request the `collections` metadata from the server.
+        Construct an interface to an EDR Server accessible at the URI specified in `server_host`.
+        The `collections` metadata is requested from the server when it is first needed.
+
+        If `requests_cache` is installed, set `cache_ttl` to cache all responses from the
+        server for that many seconds, honouring the server's own caching headers.
 
         """
         self.server_host = server_host
         self._errors = None
         self._data_handler = None
-
-        self.json = self._get_covjson(self._collections_query_str)
-        self.collections = self._get_collections()
-        self.collection_ids = self._get_collection_ids()
-        self.collection_titles = self._get_collection_titles()
+        self._uri_cache = {}
+        self._extent_cache = {}
+        self._location_index = {}
+        self._query_types = {}
+
+        # Share connections and worker threads between all requests to the server.
+        self._session = make_session(self.max_connections, cache_ttl=cache_ttl)
+        self._executor = RequestExecutor(self.max_connections)
+        self._finalizer = weakref.finalize(
+            self, _close_resources, self._session, self._executor
+        )
+
+    @cached_property
+    def json(self):
+        """The JSON response to the `collections` query, requested on first access."""
+        return self._get_covjson(self._collections_query_str)
+
+    @cached_property
+    def collections(self):
+        return self._get_collections()
+
+    @cached_property
+    def collection_ids(self):
+        return self._collection_summary[0]
+
+    @cached_property
+    def collection_titles(self):
+        return self._collection_summary[1]
+
+    @cached_property
+    def _collection_index(self):
+        return self._collection_summary[2]
+
+    @cached_property
+    def _collection_summary(self):
+        return self._summarise_collections()
 
     @property
     def errors(self):
@@ -48,44 +105,100 @@ class EDRInterface(object):
     def data_handler(self, value):
         self._data_handler = value
 
+    @property
+    def executor(self):
+        """The bounded thread pool used to make concurrent requests to the EDR Server."""
+        return self._executor
+
+    def invalidate_cache(self):
+        """
+        Discard all metadata cached from earlier requests to the EDR Server, including
+        the `collections` metadata, so that it is requested again when next needed.
+
+        """
+        self._uri_cache.clear()
+        self._extent_cache.clear()
+        self._location_index.clear()
+        self._query_types.clear()
+        for name in self._collections_attrs:
+            self.__dict__.pop(name, None)
+        session_cache = http_cache(self._session)
+        if session_cache is not None:
+            session_cache.clear()
+
+    def close(self):
+        """Close the connections and worker threads used to make requests to the EDR Server."""
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
     def __repr__(self):
         n_colls = len(self.collections)
         max_id_len = max([len(c_id) for c_id in self.collection_ids])
 
-        str_result = f"EDR Interface to {n_colls} collection{'s' if n_colls>1 else ''}:\n"
-        header = f"  #  {'ID'.ljust(max_id_len, ' ')}  Title\n"
-        str_result += header
+        lines = [
+            f"EDR Interface to {n_colls} collection{'s' if n_colls>1 else ''}:",
+            f"  #  {'ID'.ljust(max_id_len)}  Title",
+        ]
+        lines.extend(
+            f"  {i}  {c_id.ljust(max_id_len)}  {c_title}"
+            for i, (c_id, c_title) in enumerate(zip(self.collection_ids, self.collection_titles))
+        )
+        return "\n".join(lines)
+
+    def _get_covjson(self, query_str, full_uri=False, use_cache=True, refresh=False):
+        """
+        Make a request to the EDR Server and return the (coverage) JSON response.
 
-        line = "  {i}  {c_id}  {c_title}\n"
-        for i in range(len(self.collection_ids)):
-            c_id_str = self.collection_ids[i]
-            c_id_block = c_id_str.ljust(max_id_len-len(c_id_str)+2, ' ')
-            str_result += line.format(i=i, c_id=c_id_block, c_title=self.collection_titles[i])
-        return str_result
+        Successful responses are cached by URI if `use_cache` is set, so repeated
+        metadata requests do not go back to the server; set `refresh` to bypass
+        any cached response. Data queries should set `use_cache=False` to avoid
+        holding on to large data payloads.
 
-    def _get_covjson(self, query_str, full_uri=False):
-        """Make a request to the EDR Server and return the (coverage) JSON response."""
+        """
         self.errors = None
         if full_uri:
             uri = query_str
         else:
             uri = f"{self.server_host}/{query_str}"
-        result, status_code, errors = get_request(uri)
+        if use_cache and not refresh and uri in self._uri_cache:
+            return self._uri_cache[uri]
+
+        result, status_code, errors = get_request(
+            uri, session=self._session, use_cache=use_cache, refresh=refresh
+        )
         if errors is not None:
             emsg = errors
             if status_code is not None:
                 emsg += f" ({status_code})"
             self.errors = emsg
+        elif use_cache:
+            self._uri_cache[uri] = result
         return result
 
     def _get_collections(self):
         return self.json["collections"] if self.json is not None else None
 
-    def _get_collection_ids(self):
-        return [c["id"] for c in self.collections] if self.json is not None else None
+    def _summarise_collections(self):
+        """
+        In a single pass over the collections, list the `id` and `title` of each
+        collection and map both to the collection's index in the list of collections.
 
-    def _get_collection_titles(self):
-        return [c["title"] for c in self.collections] if self.json is not None else None
+        """
+        if self.json is None:
+            return None, None, {}
+        ids, titles, index = [], [], {}
+        for i, coll in enumerate(self.collections):
+            c_id, c_title = coll["id"], coll["title"]
+            ids.append(c_id)
+            titles.append(c_title)
+            index[c_id] = i
+            index[c_title] = i
+        return ids, titles, index
 
     def _get_link(self, coll_id, key, query_ref):
         """
@@ -99,7 +212,7 @@ class EDRInterface(object):
             if isinstance(query_ref, int):
                 link = links[query_ref]
             elif isinstance(query_ref, str):
-                link = filter(lambda l: query_ref in l, links)
+                link = next((l for l in links if query_ref in l), None)
             else:
                 raise KeyError(f"Invalid link reference: {query_ref!r} (type {type(query_ref)}.)")
         elif key == "data_queries":
@@ -108,12 +221,26 @@ class EDRInterface(object):
             raise ValueError(f"Cannot extract links from collection key {key!r}.")
         return link
 
-    def _get_locations_json(self, keys):
-        """Get JSON data from the server from a `locations` query."""
+    def _get_locations_json(self, keys, refresh=False):
+        """
+        Get JSON data from the server from a `locations` query. The response is
+        cached; set `refresh` to request it from the server again.
+
+        """
         coll = self.get_collection(keys)
         locs_query_uri = self._get_link(keys, "data_queries", "locations")
         named_query_uri = locs_query_uri.replace("name", coll["id"])
-        return self._get_covjson(named_query_uri, full_uri=True)
+        if refresh:
+            self._location_index.pop(coll["id"], None)
+        return self._get_covjson(named_query_uri, full_uri=True, refresh=refresh)
+
+    def _get_location_features(self, keys, refresh=False):
+        """Map the ID of each location in the collection defined by `keys` to its JSON description."""
+        coll_id = self.get_collection(keys)["id"]
+        if refresh or coll_id not in self._location_index:
+            locs_json = self._get_locations_json(keys, refresh=refresh)
+            self._location_index[coll_id] = {f["id"]: f for f in locs_json["features"]}
+        return self._location_index[coll_id]
 
     def _handle_label(self, label_item):
         """
@@ -127,9 +254,9 @@ class EDRInterface(object):
 
         """
         locale = "en"  # This could be set globally in future.
-        try:
+        if isinstance(label_item, dict):
             label = label_item.get(locale)
-        except AttributeError:
+        else:
             label = label_item
         return label
 
@@ -144,42 +271,42 @@ class EDRInterface(object):
           * a string containing the value of the `title` parameter of a collection
 
         """
-        idx = None
         if isinstance(keys, int):
             idx = keys
-        # XXX this could be replaced with `dict_list_search`.
         else:
-            for i, coll in enumerate(self.collections):
-                coll_keys = [coll["id"], coll["title"]]
-                if keys in coll_keys:
-                    idx = i
+            idx = self._collection_index.get(keys)
         if idx is None:
             emsg = f"Collection {keys!r} could not be found."
             raise KeyError(emsg)
         return self.collections[idx]
 
-    def get_locations(self, keys):
+    def get_locations(self, keys, refresh=False):
         """
         Make a `locations` request to the EDR Server and return a list of IDs of defined
-        locations in the collection defined by `keys`.
+        locations in the collection defined by `keys`. The response is cached; set
+        `refresh` to request it from the server again.
 
         """
         result = [None]
-        if "locations" in self.get_query_types(keys):
-            locs_json = self._get_locations_json(keys)
+        if self.supports_query_type(keys, "locations"):
+            locs_json = self._get_locations_json(keys, refresh=refresh)
             result = [d["id"] for d in locs_json["features"]]
         return result
 
-    def get_location_extents(self, keys, feature_id):
+    def get_location_extents(self, keys, feature_id, refresh=False):
         """
         Make a `locations` request to the EDR Server and return the bounding-box
         geometry of a specific location defined by:
           * the collection specified by `keys`
           * the location specified by `feature_id`.
 
+        The response is cached; set `refresh` to request it from the server again.
+
         """
-        locs_json = self._get_locations_json(keys)
-        feature_json = dict_list_search(locs_json["features"], "id", feature_id)
+        try:
+            feature_json = self._get_location_features(keys, refresh=refresh)[feature_id]
+        except KeyError:
+            raise ValueError(f"Location {feature_id!r} could not be found.")
         return feature_json["geometry"]
 
     def get_spatial_extent(self, keys):
@@ -202,16 +329,19 @@ class EDRInterface(object):
 
         """
         coll = self.get_collection(keys)
-        times = coll["extent"]["temporal"]
-        try:
-            t_values = times["values"]
-        except KeyError:
-            t_values = times["interval"]
-        datetime_strings = []
-        for value in t_values:
-            datetime_gen = ISO8601Expander(value)
-            datetime_strings.extend(datetime_gen.datetime_strings)
-        return datetime_strings
+        cache_key = ("temporal", coll["id"])
+        if cache_key not in self._extent_cache:
+            times = coll["extent"]["temporal"]
+            try:
+                t_values = times["values"]
+            except KeyError:
+                t_values = times["interval"]
+            datetime_strings = []
+            for value in t_values:
+                datetime_gen = ISO8601Expander(value)
+                datetime_strings.extend(datetime_gen.datetime_strings)
+            self._extent_cache[cache_key] = datetime_strings
+        return self._extent_cache[cache_key]
 
     def has_vertical_extent(self, keys):
         """Determine whether a collection described by `keys` has a vertical extent section."""
@@ -234,6 +364,17 @@ class EDRInterface(object):
         coll = self.get_collection(keys)
         return list(coll['data_queries'].keys())
 
+    def _get_query_type_set(self, coll):
+        """Return a (cached) frozenset of the query types supported by the collection JSON `coll`."""
+        coll_id = coll["id"]
+        if coll_id not in self._query_types:
+            self._query_types[coll_id] = frozenset(coll["data_queries"])
+        return self._query_types[coll_id]
+
+    def supports_query_type(self, keys, query_type):
+        """Determine whether the collection defined by `keys` supports queries of type `query_type`."""
+        return query_type in self._get_query_type_set(self.get_collection(keys))
+
     def get_collection_parameters(self, keys):
         """
         Get descriptions of the datasets (that is, environmental quantities / parameters / phenomena)
@@ -241,13 +382,16 @@ class EDRInterface(object):
 
         """
         coll = self.get_collection(keys)
-        params_dict = {}
-        for param_id, param_desc in coll["parameter_names"].items():
-            label_provider = param_desc["observedProperty"]["label"]
-            label = self._handle_label(label_provider)
-            units = param_desc["unit"]["symbol"]["value"]
-            params_dict[param_id] = {"label": label, "units": units}
-        return params_dict
+        cache_key = ("params", coll["id"])
+        if cache_key not in self._extent_cache:
+            params_dict = {}
+            for param_id, param_desc in coll["parameter_names"].items():
+                label_provider = param_desc["observedProperty"]["label"]
+                label = self._handle_label(label_provider)
+                units = param_desc["unit"]["symbol"]["value"]
+                params_dict[param_id] = {"label": label, "units": units}
+            self._extent_cache[cache_key] = params_dict
+        return self._extent_cache[cache_key]
 
     def query_position(self):
         """
@@ -268,33 +412,34 @@ class EDRInterface(object):
         """
         raise NotImplementedError
 
-    def _query(self, coll_id, query_type, param_names=None, **query_kwargs):
-        """Run a query to return data from the EDR Server."""
-        coll = self.get_collection(coll_id)
-
-        # Set up the dict to format the query string based on query type.
+    def _query(self, coll, query_type, param_names=None, **query_kwargs):
+        """Run a query to return data from the EDR Server for the collection JSON `coll`."""
+        # Set up the template and dict to format the query string based on query type.
         format_dict = dict(coll_id=coll["id"])
         if query_type == "locations":
-            loc_id = query_kwargs.pop("loc_id")
-            format_dict["query_type"] = f"locations/{loc_id}"
+            template = self._locations_query_str
+            format_dict["loc_id"] = query_kwargs.pop("loc_id")
         else:
+            template = self._query_str
             format_dict["query_type"] = query_type
 
-        # Construct the query string for the request.
-        parameter_str = "{key}={value}"
-        query_items = [parameter_str.format(key=k, value=v) for k, v in query_kwargs.items()]
+        # Construct the (URL-encoded) query string for the request.
+        query_items = list(query_kwargs.items())
         if param_names is not None:
             if not isinstance(param_names, str):
-                param_names = ",".join(param_names)
-            query_items.append(parameter_str.format(key="parameter-name", value=param_names))
-        query_str = "&".join(query_items)
-        format_dict["query_str"] = query_str
+                param_names = ",".join(map(str, param_names))
+            query_items.append(("parameter-name", param_names))
+        format_dict["query_str"] = urlencode(query_items, quote_via=quote, safe="/,:")
 
         # Make the request and set up the data handler from the response.
-        query_uri = self._query_str.format(**format_dict)
+        query_uri = template.format_map(format_dict)
         print(query_uri)
-        data_json = self._get_covjson(query_uri)
-        self.data_handler = DataHandler(data_json)
+        data_json = self._get_covjson(query_uri, use_cache=False)
+        self.data_handler = DataHandler(
+            data_json,
+            session=self._session,
+            executor=self._executor,
+        )
 
     def query(self, coll_id, query_type, param_names=None, **query_kwargs):
         """
@@ -305,7 +450,8 @@ class EDRInterface(object):
           * `query_type` is a valid query type to submit to the EDR Server. This can be one
             of `radius`, `area`, `cube`, `trajectory`, `corridor`, `position`, `locations`, `items`;
             note that not all query types are guaranteed to be supported by the EDR Server.
-            An `AssertionError` will be raised if the query type is not supported by the EDR Server.
+            If the query type is not supported by the EDR Server, no request is made and
+            `errors` is set.
             If `query_type` is set to `locations`, a location ID **must** be specified in
             the query kwargs using the key `loc_id`.
           * `param_names`: names of parameters, available in the collection defined by `coll_id`,
@@ -314,7 +460,8 @@ class EDRInterface(object):
             Valid parameters vary between query types; check the EDR documentation for more
             information. Common parameter **keys** include `coords`, `parameter-name`, `z`, `datetime`,
             `crs` and `f` (for return type of the result from the EDR Server). **Values** _must_ be
-            appropriately formatted strings.
+            appropriately formatted strings; they are URL-encoded here, so should not be escaped
+            by the caller.
 
         Note: it is up to the calling scope to ensure that valid query kwargs are
         passed. No parameter validation is performed here; a query will be constructed
@@ -324,8 +471,8 @@ class EDRInterface(object):
         self.data_handler = None  # Reset the `data_handler` attribute.
 
         # Confirm the EDR Server can handle the sort of query requested.
-        available_query_types = self.get_query_types(coll_id)
-        if query_type in available_query_types:
-            self._query(coll_id, query_type, param_names=param_names, **query_kwargs)
+        coll = self.get_collection(coll_id)
+        if query_type in self._get_query_type_set(coll):
+            self._query(coll, query_type, param_names=param_names, **query_kwargs)
         else:
             self.errors = f"Query type {query_type!r} not supported by server."
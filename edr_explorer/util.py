@@ -1,30 +1,134 @@
+from concurrent.futures import ThreadPoolExecutor
 import datetime
 from operator import add, sub
 import re
+import threading
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+try:
+    # Parse JSON responses with orjson if it is available, as it is much faster
+    # than the standard library parser for large responses.
+    import orjson as json_parser
+except ImportError:
+    import json as json_parser
 
-def get_request(uri):
+
+class _CappedRetry(Retry):
+    """
+    A `Retry` that waits no longer than `max_retry_after` seconds when the server
+    asks for a longer wait with a `Retry-After` header, as this wait is not
+    covered by the request timeout.
+
+    """
+    max_retry_after = 5
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is not None:
+            retry_after = min(retry_after, self.max_retry_after)
+        return retry_after
+
+
+def _make_base_session(cache_ttl=None):
+    """
+    Make a plain `requests.Session`, or, if `cache_ttl` is set and `requests_cache`
+    is installed, a session that can cache responses in memory for `cache_ttl` seconds
+    (or less, if the server's `Cache-Control` headers say so). Responses are only
+    cached for requests that opt in; see `get_request`.
+
+    """
+    if cache_ttl is not None:
+        try:
+            import requests_cache
+        except ImportError:
+            pass
+        else:
+            return requests_cache.CachedSession(
+                backend="memory",
+                expire_after=cache_ttl,
+                cache_control=True,
+            )
+    return requests.Session()
+
+
+def make_session(max_connections=4, cache_ttl=None):
     """
-    Make an HTTP GET request to the (EDR) Server at `uri`.
+    Make a `requests.Session` for sharing TCP/TLS connections between requests
+    made to a single EDR Server. The connection pool is limited to `max_connections`
+    connections, and requests the server is too busy to handle (HTTP 429, 502-504)
+    are retried with a backoff so that it is not overwhelmed. If the retries run out,
+    the server's final response is returned as normal.
+
+    Optionally cache (metadata) responses at the HTTP level for `cache_ttl` seconds;
+    this requires `requests_cache` to be installed.
+
+    """
+    retry = _CappedRetry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 502, 503, 504],
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=max_connections,
+        pool_maxsize=max_connections,
+        max_retries=retry,
+    )
+    session = _make_base_session(cache_ttl)
+    session.headers["Accept"] = "application/json"
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def http_cache(session):
+    """Return the HTTP response cache of `session`, or `None` if it does not cache responses."""
+    return getattr(session, "cache", None)
+
+
+def get_request(uri, session=None, timeout=60, use_cache=False, refresh=False):
+    """
+    Make an HTTP GET request to the (EDR) Server at `uri`, optionally reusing
+    the connections held by `session`. The request fails with a `Timeout` error
+    if the server does not respond within `timeout` seconds.
+
+    If `session` caches responses (see `make_session`), the response is only read
+    from and stored in its cache if `use_cache` is set; set `refresh` to replace
+    a cached response with a new one from the server.
 
     """
     response = None
     status_code = None
     errors = None
     print(uri)
+    requester = requests if session is None else session
+    request_kwargs = {"timeout": timeout}
+    if http_cache(requester) is not None:
+        if not use_cache:
+            from requests_cache import DO_NOT_CACHE
+            request_kwargs["expire_after"] = DO_NOT_CACHE
+        elif refresh:
+            request_kwargs["force_refresh"] = True
     try:
-        r = requests.get(uri)
-    except Exception as e:
+        r = requester.get(uri, **request_kwargs)
+    except requests.exceptions.RequestException as e:
         errors = e.__class__.__name__
     else:
-        response = r.json()
         status_code = r.status_code
-        if "code" in response.keys():
-            message_key_name = list(set(response.keys()) - set(["code"]))[0]
-            status_code = response["code"]
-            errors = response[message_key_name]
+        try:
+            response = json_parser.loads(r.content)
+        except ValueError as e:
+            # The server did not respond with valid JSON.
+            errors = e.__class__.__name__
+        else:
+            if "code" in response.keys():
+                message_key_name = next(iter(response.keys() - {"code"}))
+                status_code = response["code"]
+                errors = response[message_key_name]
     return response, status_code, errors
 
 
@@ -37,18 +141,69 @@ def dict_list_search(l, keys, value):
     If `keys='a'` and `value='foo'` then the first dict in the list would be returned.
 
     """
-    values_list = [d[keys] for d in l]
-    try:
-        idx = values_list.index(value)
-    except ValueError:
-        raise ValueError(f"A pair matching {{{keys}: {value}}} could not be found.")
-    else:
-        return l[idx]
+    for d in l:
+        if d[keys] == value:
+            return d
+    raise ValueError(f"A pair matching {{{keys}: {value}}} could not be found.")
+
+
+def first_index(values):
+    """
+    Map each item in the list `values` to the position of its first occurrence,
+    as `values.index(item)` would. Items can repeat, such as the endpoint shared
+    by adjoining temporal intervals.
+
+    """
+    index = {}
+    for i, value in enumerate(values):
+        index.setdefault(value, i)
+    return index
+
+
+class RequestExecutor(object):
+    """
+    A bounded thread pool for making concurrent requests to a single EDR Server.
+
+    Background work (such as prefetching data) is gated by a semaphore and is
+    dropped rather than queued when all slots are in use. There is one slot
+    fewer than there are workers, so at least one worker is always free for
+    requests made in direct response to the user.
+
+    """
+    def __init__(self, max_workers=4):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._background_slots = threading.Semaphore(max(max_workers - 1, 0))
+
+    def submit(self, fn, *args, **kwargs):
+        """Submit `fn(*args, **kwargs)` to the thread pool and return its future."""
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def submit_background(self, fn, *args, **kwargs):
+        """
+        Submit `fn(*args, **kwargs)` to the thread pool as background work.
+        Returns the future for the work, or `None` if there was no free slot for it.
+
+        """
+        if not self._background_slots.acquire(blocking=False):
+            return None
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except RuntimeError:
+            # The executor has been shut down.
+            self._background_slots.release()
+            return None
+        future.add_done_callback(lambda _: self._background_slots.release())
+        return future
+
+    def shutdown(self):
+        """Shut down the thread pool, cancelling any work that has not yet started."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
 
 
 class ISO8601Expander(object):
     isofmt_short = "%Y-%m-%dT%H:%MZ"
     isofmt = "%Y-%m-%dT%H:%M:%SZ"
+    duration_element_re = re.compile(r"\d+[A-Z]")
 
     def __init__(self, iso8601_string):
         self.iso8601_string = iso8601_string
@@ -56,6 +211,7 @@ class ISO8601Expander(object):
         self._datetimes = None
         self._datetime_strings = None
         
+        self._classified = False
         self._start_date = None
         self._end_date = None
         self._repeat = None
@@ -83,8 +239,7 @@ class ISO8601Expander(object):
 
     @property
     def start_date(self):
-        if self._start_date is None:
-            self._classify_string()
+        self._ensure_classified()
         return self._start_date
     @start_date.setter
     def start_date(self, value):
@@ -92,8 +247,7 @@ class ISO8601Expander(object):
 
     @property
     def end_date(self):
-        if self._end_date is None:
-            self._classify_string()
+        self._ensure_classified()
         return self._end_date
     @end_date.setter
     def end_date(self, value):
@@ -101,8 +255,7 @@ class ISO8601Expander(object):
 
     @property
     def duration(self):
-        if self._duration is None:
-            self._classify_string()
+        self._ensure_classified()
         return self._duration
     @duration.setter
     def duration(self, value):
@@ -110,13 +263,18 @@ class ISO8601Expander(object):
 
     @property
     def repeat(self):
-        if self._repeat is None:
-            self._classify_string()
+        self._ensure_classified()
         return self._repeat
     @repeat.setter
     def repeat(self, value):
         self._repeat = value
 
+    def _ensure_classified(self):
+        """Split the ISO8601 string into its elements, if this has not been done yet."""
+        if not self._classified:
+            self._classify_string()
+            self._classified = True
+
     def _classify_string(self):
         elements = self.iso8601_string.split("/")
         # Handle optional `--` delimiter.
@@ -177,9 +335,8 @@ class ISO8601Expander(object):
         return result
 
     def _split_duration(self, duration_str, datetime_type):
-        bits = re.split(r"(\d+[A-Z]{1})", duration_str)[1::2]
         bits_dict = {}
-        for bit in bits:
+        for bit in self.duration_element_re.findall(duration_str):
             value, unit_letter = bit[:-1], bit[-1]
             unit = self._get_unit(unit_letter, datetime_type)
             bits_dict[unit] = int(value)
@@ -208,10 +365,10 @@ class ISO8601Expander(object):
         a `datetime.timedelta` instance.
 
         """
-        if self.duration == self.element_not_set:
+        if self._duration == self.element_not_set:
             result = None
         else:
-            date_dur, time_dur = self.duration.strip("P").split("T")
+            date_dur, time_dur = self._duration.strip("P").split("T")
             duration_bits = self._split_duration(time_dur, "time")
             if len(date_dur):
                 duration_bits.update(self._split_duration(date_dur, "date"))
@@ -224,15 +381,15 @@ class ISO8601Expander(object):
         If the repeat value is not present, there is implicitly just the one repeat.
 
         """
-        if self.repeat == self.element_not_set:
+        if self._repeat == self.element_not_set:
             result = 1
         else:
-            result = int(self.repeat.strip("R"))
+            result = int(self._repeat.strip("R"))
         return result
 
     def _handle_datetime(self, ref):
         """Handle the datetime string defined by `ref` by converting it to a datetime object."""
-        dt = getattr(self, f"{ref}_date")
+        dt = getattr(self, f"_{ref}_date")
         if dt == self.element_not_set:
             result = None
         else:
@@ -247,12 +404,13 @@ class ISO8601Expander(object):
         return result
 
     def _build_datetimes(self):
+        self._ensure_classified()
         start_date = self._handle_datetime("start")
         end_date = self._handle_datetime("end")
         repeat = self._handle_repeat()
         duration = self._handle_duration()
         # print(start_date, end_date, repeat, duration)
-        if start_date is not None and all([val is None for val in [end_date, duration]]):
+        if start_date is not None and end_date is None and duration is None:
             self.datetimes = [start_date]
         elif start_date is not None and end_date is not None:
             self.datetimes = [start_date, end_date]
@@ -268,14 +426,9 @@ class ISO8601Expander(object):
             else:
                 raise ValueError("Invalid ISO8601 date string.")
 
-            self.datetimes = [date]
-            for _ in range(repeat):
-                new_date = math_func(date, duration)
-                self.datetimes.append(new_date)
-                date = new_date
-
-            if reverse:
-                self.datetimes = self.datetimes[::-1]
+            # Offset each datetime from the first, rather than accumulating offsets.
+            offsets = range(repeat, -1, -1) if reverse else range(repeat + 1)
+            self.datetimes = [math_func(date, duration * i) for i in offsets]
 
     def _build_datetime_strings(self):
         self.datetime_strings = [datetime.datetime.strftime(dt, self.isofmt) for dt in self.datetimes]
\ No newline at end of file